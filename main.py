@@ -1,11 +1,24 @@
-from fastapi import FastAPI, HTTPException
+import os
+
+# Tesseract's OpenMP threading slows down single-image OCR; parallelism comes
+# from running several Tesseract processes at once instead. Must be set before
+# any OCR runs so the spawned processes inherit it.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List, Dict
+import msgspec
+from typing import Optional, List, Dict, Set, Tuple, Union
+from contextlib import asynccontextmanager
 import asyncio
 import time
 import base64
+import hashlib
 import io
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
 from PIL import Image
 import pytesseract
 import logging
@@ -15,10 +28,18 @@ from qa_engine import QAEngine
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop background workers with the application"""
+    ocr_batcher.start()
+    yield
+    await ocr_batcher.stop()
+
 app = FastAPI(
     title="TDS Virtual TA",
     description="Virtual Teaching Assistant for Tools in Data Science course",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -33,32 +54,268 @@ app.add_middleware(
 # Initialize QA Engine
 qa_engine = QAEngine()
 
-class QuestionRequest(BaseModel):
+# Separate pools so slow OCR never starves QA lookups and vice versa. Created at
+# import (threads start lazily) so they exist even if the host skips lifespan events.
+# OCR is CPU-bound: one worker per core for single-threaded Tesseract runs.
+ocr_pool = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix='ocr')
+qa_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix='qa')
+
+# msgspec structs decode and encode in C, which matters for large base64 images
+class QuestionRequest(msgspec.Struct):
     question: str
     image: Optional[str] = None
 
-class Link(BaseModel):
+class Link(msgspec.Struct):
     url: str
     text: str
 
-class QuestionResponse(BaseModel):
+class QuestionResponse(msgspec.Struct):
     answer: str
     links: List[Link]
 
-def extract_text_from_image(base64_image: str) -> str:
+# FastAPI can't see msgspec types, so publish their schemas to the OpenAPI docs by hand
+(_request_schema, _response_schema), _schema_components = msgspec.json.schema_components(
+    [QuestionRequest, QuestionResponse], ref_template="#/components/schemas/{name}"
+)
+_default_openapi = app.openapi
+
+def openapi():
+    if app.openapi_schema is None:
+        schema = _default_openapi()
+        schema.setdefault("components", {}).setdefault("schemas", {}).update(_schema_components)
+    return app.openapi_schema
+
+app.openapi = openapi
+
+# OCR results keyed by the SHA-256 digest of the base64 payload
+OCR_CACHE_SIZE = 512
+_ocr_cache: OrderedDict[bytes, str] = OrderedDict()
+_ocr_cache_lock = threading.Lock()
+
+# Images submitted within this window (seconds) share one Tesseract run
+OCR_BATCH_WINDOW = 0.02
+OCR_BATCH_SIZE = 16
+
+# Tesseract runs single-threaded, so a batch is spread over one process per core
+OCR_WORKERS = os.cpu_count() or 1
+
+# Larger images are downscaled before OCR; screenshots stay legible at this size
+OCR_MAX_DIMENSION = 2000
+
+# PSM 6 treats the image as one uniform block of text, skipping layout analysis;
+# OEM 1 selects the LSTM engine only
+TESSERACT_CONFIG = '--psm 6 --oem 1 -l eng'
+
+def otsu_threshold(histogram: List[int]) -> int:
+    """Pick the grey level that best separates a 256-bin histogram into two classes"""
+    total = sum(histogram)
+    weighted_total = sum(level * count for level, count in enumerate(histogram))
+    
+    best_level, best_variance = 0, -1.0
+    background, weighted_background = 0, 0
+    for level, count in enumerate(histogram):
+        background += count
+        weighted_background += level * count
+        foreground = total - background
+        if background == 0 or foreground == 0:
+            continue
+        mean_background = weighted_background / background
+        mean_foreground = (weighted_total - weighted_background) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_level, best_variance = level, variance
+    
+    return best_level
+
+def load_image(image_data: bytes) -> Image.Image:
+    """Decode raw image bytes into a Pillow image ready for OCR"""
+    # BytesIO shares the bytes object's buffer, no copy is made until it is written to
+    image = Image.open(io.BytesIO(image_data))
+    
+    # Lossless PNGs are almost always screenshots with evenly lit, high contrast text
+    is_screenshot = image.format == 'PNG'
+    
+    # For JPEGs, have libjpeg decode straight to grayscale and scale down during
+    # decoding; a no-op for other formats. Pillow picks the scale per axis, so the
+    # box must keep the aspect ratio or the shorter side prevents any reduction
+    scale = max(max(image.size) / OCR_MAX_DIMENSION, 1)
+    image.draft('L', (int(image.width / scale), int(image.height / scale)))
+    image.load()
+    
+    # Tesseract works on grayscale or bitonal input, so avoid a copy if already there
+    if image.mode not in ('L', '1'):
+        image = image.convert('L')
+    
+    if max(image.size) > OCR_MAX_DIMENSION:
+        image.thumbnail((OCR_MAX_DIMENSION, OCR_MAX_DIMENSION), Image.Resampling.LANCZOS)
+    
+    # Hand Tesseract pre-binarized screenshots; a global threshold would erase
+    # text in unevenly lit photos
+    if is_screenshot and image.mode == 'L':
+        histogram = image.histogram()
+        threshold = otsu_threshold(histogram)
+        
+        # Median grey level: mostly-dark images are dark-theme screenshots (editors,
+        # terminals) whose dim coloured text does not survive a cut-off, so they
+        # stay grayscale for Tesseract
+        half, seen, median = sum(histogram) / 2, 0, 0
+        for median, count in enumerate(histogram):
+            seen += count
+            if seen >= half:
+                break
+        
+        if median > threshold:
+            image = image.point(lambda p: 255 if p > threshold else 0, mode='1')
+    
+    return image
+
+def ocr_batch(images: List[bytes]) -> List[Union[str, Exception]]:
+    """Extract text from several images using a single Tesseract invocation"""
+    results: List[Union[str, Exception]] = [""] * len(images)
+    loaded: List[Tuple[int, Image.Image]] = []
+    
+    # A broken image only fails its own request, not the whole batch
+    for i, image_data in enumerate(images):
+        try:
+            loaded.append((i, load_image(image_data)))
+        except Exception as e:
+            results[i] = e
+    
+    if len(loaded) == 1:
+        i, image = loaded[0]
+        results[i] = pytesseract.image_to_string(image, config=TESSERACT_CONFIG).strip()
+    elif loaded:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = []
+            for i, image in loaded:
+                path = os.path.join(tmp_dir, f"{i}.png")
+                image.save(path)
+                paths.append(path)
+            
+            # Tesseract treats a .txt input as a list of images, one per line
+            list_path = os.path.join(tmp_dir, "images.txt")
+            with open(list_path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(paths) + '\n')
+            
+            # Every page of output is terminated by a form feed
+            pages = pytesseract.image_to_string(list_path, config=TESSERACT_CONFIG).split('\f')
+        
+        if len(pages) == len(loaded) + 1:
+            for (i, _), page in zip(loaded, pages):
+                results[i] = page.strip()
+        else:
+            logger.warning("Batched OCR returned an unexpected page count, retrying images one by one")
+            for i, image in loaded:
+                results[i] = pytesseract.image_to_string(image, config=TESSERACT_CONFIG).strip()
+    
+    return results
+
+class OCRBatcher:
+    """Coalesces OCR requests that arrive close together into shared Tesseract runs"""
+    
+    def __init__(self, executor: Optional[Executor] = None,
+                 max_batch: int = OCR_BATCH_SIZE, max_wait: float = OCR_BATCH_WINDOW):
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor = executor
+        self._batches: Set[asyncio.Task] = set()
+    
+    def start(self):
+        """Start the background batching task on the running event loop"""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop the background batching task"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        
+        # Requests still queued will never be batched now
+        queue, self._queue = self._queue, None
+        while not queue.empty():
+            _, future = queue.get_nowait()
+            future.cancel()
+    
+    async def submit(self, image_data: bytes) -> str:
+        """Queue an image for OCR and wait for its text"""
+        if self._queue is None:
+            # Not started (e.g. the host skipped lifespan events): OCR this image on its own
+            loop = asyncio.get_running_loop()
+            result = (await loop.run_in_executor(self._executor, ocr_batch, [image_data]))[0]
+            if isinstance(result, Exception):
+                raise result
+            return result
+        
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image_data, future))
+        return await future
+    
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            
+            # Give concurrent requests a short window to join this batch
+            if self._queue.empty():
+                await asyncio.sleep(self.max_wait)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            
+            # Split the batch so every core runs its own Tesseract process, and
+            # process without blocking collection of the next batch; keep a
+            # reference so each task is not garbage collected while running
+            chunk_size = -(-len(batch) // OCR_WORKERS)
+            for start in range(0, len(batch), chunk_size):
+                task = asyncio.create_task(self._process(batch[start:start + chunk_size]))
+                self._batches.add(task)
+                task.add_done_callback(self._batches.discard)
+    
+    async def _process(self, batch: List[Tuple[bytes, asyncio.Future]]):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self._executor, ocr_batch, [image_data for image_data, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+ocr_batcher = OCRBatcher(executor=ocr_pool)
+
+async def extract_text_from_image(base64_image: str) -> str:
     """Extract text from base64-encoded image using OCR"""
+    cache_key = hashlib.sha256(base64_image.encode()).digest()
+    with _ocr_cache_lock:
+        cached = _ocr_cache.get(cache_key)
+        if cached is not None:
+            _ocr_cache.move_to_end(cache_key)
+            return cached
+    
     try:
         # Decode base64 image
         image_data = base64.b64decode(base64_image)
-        image = Image.open(io.BytesIO(image_data))
-        
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
         
         # Extract text using OCR
-        extracted_text = pytesseract.image_to_string(image)
-        return extracted_text.strip()
+        extracted_text = await ocr_batcher.submit(image_data)
+        
+        with _ocr_cache_lock:
+            _ocr_cache[cache_key] = extracted_text
+            if len(_ocr_cache) > OCR_CACHE_SIZE:
+                _ocr_cache.popitem(last=False)
+        
+        return extracted_text
     
     except Exception as e:
         logger.error(f"Error extracting text from image: {str(e)}")
@@ -81,20 +338,43 @@ async def health_check():
     """Health check endpoint"""
     return {"status": "healthy", "timestamp": time.time()}
 
-@app.post("/api/", response_model=QuestionResponse)
-async def process_question(request: QuestionRequest):
+@app.post(
+    "/api/",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": _request_schema}},
+        },
+        "responses": {
+            "200": {"content": {"application/json": {"schema": _response_schema}}},
+            "422": {
+                "description": "Invalid request body",
+                "content": {"application/json": {"schema": {
+                    "type": "object",
+                    "properties": {"detail": {"type": "string"}},
+                }}},
+            },
+        },
+    },
+)
+async def process_question(raw_request: Request):
     """
     Process student question and return relevant answers with supporting links
     """
     start_time = time.time()
     
+    try:
+        request = msgspec.json.decode(await raw_request.body(), type=QuestionRequest)
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid request: {str(e)}")
+    
     try:
         # Combine question text with OCR text if image is provided
         full_question = request.question
         
         if request.image:
             try:
-                ocr_text = extract_text_from_image(request.image)
+                ocr_text = await extract_text_from_image(request.image)
                 if ocr_text:
                     full_question = f"{request.question}\n\nExtracted from image: {ocr_text}"
             except Exception as e:
@@ -103,8 +383,9 @@ async def process_question(request: QuestionRequest):
         # Process question with timeout
         try:
             # Use asyncio.wait_for to enforce 30-second timeout
+            loop = asyncio.get_running_loop()
             answer_data = await asyncio.wait_for(
-                asyncio.to_thread(qa_engine.get_answer, full_question),
+                loop.run_in_executor(qa_pool, qa_engine.get_answer, full_question),
                 timeout=30.0
             )
         except asyncio.TimeoutError:
@@ -125,7 +406,7 @@ async def process_question(request: QuestionRequest):
         processing_time = time.time() - start_time
         logger.info(f"Question processed in {processing_time:.2f} seconds")
         
-        return response
+        return Response(content=msgspec.json.encode(response), media_type="application/json")
     
     except HTTPException:
         raise
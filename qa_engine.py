@@ -1,46 +1,263 @@
-import json
+import orjson
 import os
-from typing import Dict, List, Any, Optional
-from fuzzywuzzy import fuzz, process
+import pickle
+from typing import Dict, List, Any, Optional, Tuple
+from rapidfuzz import fuzz
+from rapidfuzz.process import cdist
+import ahocorasick
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
 import re
 import logging
+import threading
+from collections import OrderedDict
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+_WS_RE = re.compile(r'\s+')
+_PUNCT_RE = re.compile(r'[^\w\s\-\.\?\!]')
+_WORD_RE = re.compile(r'\b\w{4,}\b')
+_TOKEN_RE = re.compile(r'\w+')
+
+# Technical terms that might be important
+TECH_TERMS = [
+    'python', 'pandas', 'numpy', 'matplotlib', 'seaborn', 'sklearn',
+    'jupyter', 'notebook', 'dataframe', 'csv', 'api', 'sql', 'database',
+    'visualization', 'plot', 'chart', 'regression', 'classification',
+    'machine learning', 'ml', 'data science', 'statistics', 'analysis'
+]
+
+DISCOURSE_PATH = "data/tds_posts.json"
+CONTENT_PATH = "data/course_content.json"
+
+# Pickle of the loaded and preprocessed data, reused while the JSON files are unchanged
+CACHE_PATH = ".cache/qa.pkl"
+# Bump whenever the precomputed fields or the index layout change
+CACHE_VERSION = 3
+
+# Number of TF-IDF candidates passed on to fuzzy scoring per query
+TFIDF_CANDIDATES = 50
+
+# Fuzzy scoring only fans out across threads above this many texts; requests
+# already run in parallel on the QA pool, so small batches stay single-threaded
+PARALLEL_SCORE_MIN = 5000
+
+# Maximum number of answers kept in the LRU answer cache
+ANSWER_CACHE_SIZE = 1024
+
 class QAEngine:
     def __init__(self):
         self.discourse_posts = []
         self.course_content = []
+        self._post_titles = np.array([], dtype=object)
+        self._post_texts = np.array([], dtype=object)
+        self._content_texts = np.array([], dtype=object)
+        self._post_index = (None, None)
+        self._content_index = (None, None)
+        self._ans_cache: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._ans_cache_lock = threading.Lock()
+        
+        # Match every tech term in a single pass over the text
+        self._ac = ahocorasick.Automaton()
+        for term in TECH_TERMS:
+            self._ac.add_word(term, term)
+        self._ac.make_automaton()
+        
         self.load_data()
     
     def load_data(self):
         """Load discourse posts and course content from JSON files"""
+        # Cached answers were computed against the previous data
+        with self._ans_cache_lock:
+            self._ans_cache.clear()
+        
+        sources = self._source_mtimes()
+        if self._load_cache(sources):
+            return
+        
         try:
             # Load discourse posts
-            discourse_path = "data/tds_posts.json"
-            if os.path.exists(discourse_path):
-                with open(discourse_path, 'r', encoding='utf-8') as f:
-                    self.discourse_posts = json.load(f)
+            if os.path.exists(DISCOURSE_PATH):
+                self.discourse_posts = self._read_records(DISCOURSE_PATH)
                 logger.info(f"Loaded {len(self.discourse_posts)} discourse posts")
             else:
-                logger.warning(f"Discourse posts file not found: {discourse_path}")
+                logger.warning(f"Discourse posts file not found: {DISCOURSE_PATH}")
                 self.discourse_posts = []
             
             # Load course content
-            content_path = "data/course_content.json"
-            if os.path.exists(content_path):
-                with open(content_path, 'r', encoding='utf-8') as f:
-                    self.course_content = json.load(f)
+            if os.path.exists(CONTENT_PATH):
+                self.course_content = self._read_records(CONTENT_PATH)
                 logger.info(f"Loaded {len(self.course_content)} course content items")
             else:
-                logger.warning(f"Course content file not found: {content_path}")
+                logger.warning(f"Course content file not found: {CONTENT_PATH}")
                 self.course_content = []
         
         except Exception as e:
             logger.error(f"Error loading data: {str(e)}")
             self.discourse_posts = []
             self.course_content = []
+        
+        self._precompute()
+        self._save_cache(sources)
+    
+    def _read_records(self, path: str) -> List[Dict]:
+        """Read records from a JSON array file or a JSON Lines file"""
+        with open(path, 'rb') as f:
+            head = f.read(64).lstrip()
+            f.seek(0)
+            
+            if head.startswith(b'['):
+                return orjson.loads(f.read())
+            
+            # JSON Lines, as written by the scraper: parse line by line
+            return [orjson.loads(line) for line in f if line.strip()]
+    
+    def _source_mtimes(self) -> Dict[str, Optional[float]]:
+        """Modification times of the JSON sources, None for missing files"""
+        return {
+            path: os.path.getmtime(path) if os.path.exists(path) else None
+            for path in (DISCOURSE_PATH, CONTENT_PATH)
+        }
+    
+    def _load_cache(self, sources: Dict[str, Optional[float]]) -> bool:
+        """Restore preprocessed data from the pickle cache if it matches the JSON sources"""
+        if not os.path.exists(CACHE_PATH):
+            return False
+        
+        try:
+            with open(CACHE_PATH, 'rb') as f:
+                cache = pickle.load(f)
+            
+            if cache.get('version') != CACHE_VERSION or cache.get('sources') != sources:
+                return False
+            
+            self.discourse_posts = cache['posts']
+            self.course_content = cache['content']
+            self._post_titles = cache['post_titles']
+            self._post_texts = cache['post_texts']
+            self._content_texts = cache['content_texts']
+            self._post_index = cache['post_index']
+            self._content_index = cache['content_index']
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable cache {CACHE_PATH}: {str(e)}")
+            return False
+        
+        logger.info(
+            f"Loaded {len(self.discourse_posts)} discourse posts and "
+            f"{len(self.course_content)} course content items from cache"
+        )
+        return True
+    
+    def _save_cache(self, sources: Dict[str, Optional[float]]):
+        """Write the preprocessed data to the pickle cache for the next start"""
+        cache = {
+            'version': CACHE_VERSION,
+            'sources': sources,
+            'posts': self.discourse_posts,
+            'content': self.course_content,
+            'post_titles': self._post_titles,
+            'post_texts': self._post_texts,
+            'content_texts': self._content_texts,
+            'post_index': self._post_index,
+            'content_index': self._content_index
+        }
+        
+        try:
+            os.makedirs(os.path.dirname(CACHE_PATH), exist_ok=True)
+            # Write then rename so concurrent workers never read a partial file
+            tmp_path = f"{CACHE_PATH}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(cache, f, protocol=5)
+            os.replace(tmp_path, CACHE_PATH)
+        except Exception as e:
+            # A read-only filesystem (e.g. serverless) just means no cache
+            logger.warning(f"Could not write cache {CACHE_PATH}: {str(e)}")
+    
+    def _precompute(self):
+        """Preprocess the searchable text of every item once, so queries don't redo it"""
+        for post in self.discourse_posts:
+            post['_pp_title'] = self.preprocess_text(post.get('title', ''))
+            post['_pp_text'] = self.preprocess_text(f"{post.get('title', '')} {post.get('content', '')}")
+            post['_tokens'] = frozenset(_TOKEN_RE.findall(post['_pp_text']))
+        
+        for content in self.course_content:
+            content['_pp_text'] = self.preprocess_text(f"{content.get('title', '')} {content.get('description', '')}")
+            content['_tokens'] = frozenset(_TOKEN_RE.findall(content['_pp_text']))
+        
+        # Object arrays so candidate subsets can be taken with fancy indexing
+        self._post_titles = np.array([post['_pp_title'] for post in self.discourse_posts], dtype=object)
+        self._post_texts = np.array([post['_pp_text'] for post in self.discourse_posts], dtype=object)
+        self._content_texts = np.array([content['_pp_text'] for content in self.course_content], dtype=object)
+        
+        self._post_index = self._build_index(list(self._post_texts))
+        self._content_index = self._build_index(list(self._content_texts))
+    
+    def _build_index(self, texts: List[str]) -> Tuple[Optional[TfidfVectorizer], Any]:
+        """Fit a TF-IDF index used to shortlist candidates before fuzzy scoring"""
+        if len(texts) <= TFIDF_CANDIDATES:
+            # Small corpora are fuzzy-scored in full, an index would not prune anything
+            return None, None
+        
+        try:
+            vectorizer = TfidfVectorizer(ngram_range=(1, 2), min_df=2)
+            matrix = vectorizer.fit_transform(texts)
+            return vectorizer, matrix
+        except ValueError as e:
+            logger.warning(f"Could not build TF-IDF index: {str(e)}")
+            return None, None
+    
+    def _find_candidates(self, index: Tuple[Optional[TfidfVectorizer], Any], question_processed: str, total: int) -> np.ndarray:
+        """Return the indices (in corpus order) of the items worth fuzzy scoring"""
+        vectorizer, matrix = index
+        if vectorizer is None:
+            return np.arange(total)
+        
+        # Rows are L2-normalised, so the dot product is the cosine similarity
+        query = vectorizer.transform([question_processed])
+        scores = (matrix @ query.T).toarray().ravel()
+        
+        # No vocabulary overlap (typos, unseen words): the ranking would be
+        # arbitrary, so fall back to fuzzy scoring everything
+        if query.nnz == 0 or scores.max() == 0:
+            return np.arange(total)
+        
+        candidates = np.argpartition(-scores, TFIDF_CANDIDATES)[:TFIDF_CANDIDATES]
+        return np.sort(candidates)
+    
+    def _score(self, question_processed: str, texts: np.ndarray) -> np.ndarray:
+        """Fuzzy-score the question against every text in one vectorized call"""
+        workers = -1 if len(texts) > PARALLEL_SCORE_MIN else 1
+        return cdist([question_processed], texts, scorer=fuzz.partial_ratio, dtype=np.float64, workers=workers)[0]
+    
+    def _top_matches(self, scores: np.ndarray, threshold: float, limit: int) -> np.ndarray:
+        """Indices of the best scores at or above threshold, highest first"""
+        matched = np.flatnonzero(scores >= threshold)
+        
+        # Partial selection instead of sorting every match: find the limit-th
+        # best score and keep everything at least that good, so items tied at
+        # the cut-off all stay in play
+        if len(matched) > limit:
+            kth = np.partition(scores[matched], len(matched) - limit)[len(matched) - limit]
+            matched = matched[scores[matched] >= kth]
+        
+        # Stable, so ties keep corpus order
+        return matched[np.argsort(-scores[matched], kind='stable')][:limit]
+    
+    def _count_keyword_matches(self, keywords: frozenset, items: List[Dict]) -> np.ndarray:
+        """Count how many of the keywords occur in each item's preprocessed text"""
+        # Single words are looked up in the precomputed token set; only
+        # multi-word terms such as 'machine learning' need a substring scan
+        words = frozenset(keyword for keyword in keywords if ' ' not in keyword)
+        phrases = [keyword for keyword in keywords if ' ' in keyword]
+        
+        return np.fromiter(
+            (
+                len(words & item['_tokens']) + sum(1 for phrase in phrases if phrase in item['_pp_text'])
+                for item in items
+            ),
+            dtype=np.int64, count=len(items)
+        )
     
     def preprocess_text(self, text: str) -> str:
         """Preprocess text for better matching"""
@@ -51,36 +268,25 @@ class QAEngine:
         text = text.lower()
         
         # Remove extra whitespace
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = _WS_RE.sub(' ', text).strip()
         
         # Remove special characters but keep alphanumeric and basic punctuation
-        text = re.sub(r'[^\w\s\-\.\?\!]', '', text)
+        text = _PUNCT_RE.sub('', text)
         
         return text
     
     def extract_keywords(self, text: str) -> List[str]:
         """Extract relevant keywords from question text"""
-        # Common data science and programming terms
-        keywords = []
         text_lower = text.lower()
         
-        # Technical terms that might be important
-        tech_terms = [
-            'python', 'pandas', 'numpy', 'matplotlib', 'seaborn', 'sklearn',
-            'jupyter', 'notebook', 'dataframe', 'csv', 'api', 'sql', 'database',
-            'visualization', 'plot', 'chart', 'regression', 'classification',
-            'machine learning', 'ml', 'data science', 'statistics', 'analysis'
-        ]
-        
-        for term in tech_terms:
-            if term in text_lower:
-                keywords.append(term)
+        # Common data science and programming terms
+        keywords = {term for _, term in self._ac.iter(text_lower)}
         
         # Extract words that are likely to be important (longer than 3 characters)
-        words = re.findall(r'\b\w{4,}\b', text_lower)
-        keywords.extend(words[:10])  # Limit to top 10 words
+        words = _WORD_RE.findall(text_lower)
+        keywords.update(words[:10])  # Limit to top 10 words
         
-        return list(set(keywords))  # Remove duplicates
+        return list(keywords)
     
     def find_similar_posts(self, question: str, threshold: int = 60) -> List[Dict]:
         """Find discourse posts similar to the question"""
@@ -88,37 +294,33 @@ class QAEngine:
             return []
         
         question_processed = self.preprocess_text(question)
-        similar_posts = []
+        keywords = frozenset(self.extract_keywords(question))
         
-        for post in self.discourse_posts:
-            # Combine title and content for matching
-            post_text = f"{post.get('title', '')} {post.get('content', '')}"
-            post_text_processed = self.preprocess_text(post_text)
-            
-            # Calculate similarity scores
-            title_score = fuzz.partial_ratio(question_processed, self.preprocess_text(post.get('title', '')))
-            content_score = fuzz.partial_ratio(question_processed, post_text_processed)
-            combined_score = max(title_score, content_score * 0.8)  # Weight content slightly less
-            
-            # Check for keyword matches
-            keywords = self.extract_keywords(question)
-            keyword_matches = sum(1 for keyword in keywords if keyword in post_text_processed)
-            keyword_bonus = min(keyword_matches * 10, 30)  # Max 30 point bonus
-            
-            final_score = combined_score + keyword_bonus
-            
-            if final_score >= threshold:
-                similar_posts.append({
-                    'post': post,
-                    'score': final_score,
-                    'title_score': title_score,
-                    'content_score': content_score,
-                    'keyword_matches': keyword_matches
-                })
+        candidates = self._find_candidates(self._post_index, question_processed, len(self.discourse_posts))
+        
+        # Calculate similarity scores
+        title_scores = self._score(question_processed, self._post_titles[candidates])
+        content_scores = self._score(question_processed, self._post_texts[candidates])
+        combined_scores = np.maximum(title_scores, content_scores * 0.8)  # Weight content slightly less
+        
+        # Check for keyword matches
+        keyword_matches = self._count_keyword_matches(keywords, [self.discourse_posts[i] for i in candidates])
+        keyword_bonus = np.minimum(keyword_matches * 10, 30)  # Max 30 point bonus
         
-        # Sort by score (highest first)
-        similar_posts.sort(key=lambda x: x['score'], reverse=True)
-        return similar_posts[:5]  # Return top 5 matches
+        final_scores = combined_scores + keyword_bonus
+        
+        top = self._top_matches(final_scores, threshold, 5)  # Return top 5 matches
+        
+        return [
+            {
+                'post': self.discourse_posts[candidates[i]],
+                'score': float(final_scores[i]),
+                'title_score': float(title_scores[i]),
+                'content_score': float(content_scores[i]),
+                'keyword_matches': int(keyword_matches[i])
+            }
+            for i in top
+        ]
     
     def find_relevant_content(self, question: str, threshold: int = 50) -> List[Dict]:
         """Find relevant course content"""
@@ -126,33 +328,29 @@ class QAEngine:
             return []
         
         question_processed = self.preprocess_text(question)
-        relevant_content = []
+        keywords = frozenset(self.extract_keywords(question))
         
-        for content in self.course_content:
-            # Combine title and description for matching
-            content_text = f"{content.get('title', '')} {content.get('description', '')}"
-            content_text_processed = self.preprocess_text(content_text)
-            
-            # Calculate similarity score
-            score = fuzz.partial_ratio(question_processed, content_text_processed)
-            
-            # Check for keyword matches
-            keywords = self.extract_keywords(question)
-            keyword_matches = sum(1 for keyword in keywords if keyword in content_text_processed)
-            keyword_bonus = min(keyword_matches * 15, 40)  # Max 40 point bonus
-            
-            final_score = score + keyword_bonus
-            
-            if final_score >= threshold:
-                relevant_content.append({
-                    'content': content,
-                    'score': final_score,
-                    'keyword_matches': keyword_matches
-                })
+        candidates = self._find_candidates(self._content_index, question_processed, len(self.course_content))
         
-        # Sort by score (highest first)
-        relevant_content.sort(key=lambda x: x['score'], reverse=True)
-        return relevant_content[:3]  # Return top 3 matches
+        # Calculate similarity scores
+        scores = self._score(question_processed, self._content_texts[candidates])
+        
+        # Check for keyword matches
+        keyword_matches = self._count_keyword_matches(keywords, [self.course_content[i] for i in candidates])
+        keyword_bonus = np.minimum(keyword_matches * 15, 40)  # Max 40 point bonus
+        
+        final_scores = scores + keyword_bonus
+        
+        top = self._top_matches(final_scores, threshold, 3)  # Return top 3 matches
+        
+        return [
+            {
+                'content': self.course_content[candidates[i]],
+                'score': float(final_scores[i]),
+                'keyword_matches': int(keyword_matches[i])
+            }
+            for i in top
+        ]
     
     def generate_answer(self, question: str, similar_posts: List[Dict], relevant_content: List[Dict]) -> str:
         """Generate a comprehensive answer based on found content"""
@@ -204,6 +402,14 @@ class QAEngine:
                 "links": []
             }
         
+        # Identical questions (ignoring case and surrounding whitespace) get identical answers
+        cache_key = question.strip().lower()
+        with self._ans_cache_lock:
+            cached = self._ans_cache.get(cache_key)
+            if cached is not None:
+                self._ans_cache.move_to_end(cache_key)
+                return cached
+        
         # Find similar posts and relevant content
         similar_posts = self.find_similar_posts(question)
         relevant_content = self.find_relevant_content(question)
@@ -235,10 +441,18 @@ class QAEngine:
         # Limit total links to 5
         links = links[:5]
         
-        return {
+        result = {
             "answer": answer,
             "links": links
         }
+        
+        with self._ans_cache_lock:
+            self._ans_cache[cache_key] = result
+            self._ans_cache.move_to_end(cache_key)
+            if len(self._ans_cache) > ANSWER_CACHE_SIZE:
+                self._ans_cache.popitem(last=False)
+        
+        return result
     
     def get_stats(self) -> Dict[str, Any]:
         """Get statistics about the knowledge base"""
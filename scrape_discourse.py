@@ -1,28 +1,95 @@
-import requests
-from bs4 import BeautifulSoup
-import json
-import time
+import aiohttp
+import asyncio
+from aiolimiter import AsyncLimiter
+from selectolax.lexbor import LexborHTMLParser
+import orjson
 import os
+import shelve
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import List, Dict, Optional
 import logging
 import trafilatura
-from urllib.parse import urljoin, urlparse
+from urllib.parse import urljoin, urlparse, urlencode
 import re
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Politeness limits towards the forum
+MAX_CONCURRENT_REQUESTS = 8
+REQUESTS_PER_SECOND = 5
+
+# ETags and payloads of earlier topic responses, so re-scrapes can use conditional
+# requests. One entry per topic, never evicted: delete the file to reclaim space.
+ETAG_CACHE_PATH = ".cache/etag.db"
+
 class DiscourseScraper:
     def __init__(self, base_url: str = "https://discourse.onlinedegree.iitm.ac.in/"):
         self.base_url = base_url.rstrip('/')
-        self.session = requests.Session()
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        })
+        self.headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Accept-Encoding': 'gzip, deflate'
+        }
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.etags: Optional[shelve.Shelf] = None
+        self._etag_io: Optional[ThreadPoolExecutor] = None
+        self.semaphore: Optional[asyncio.Semaphore] = None
+        self.limiter: Optional[AsyncLimiter] = None
+    
+    async def __aenter__(self):
+        # A single session for the whole run keeps connections alive between requests
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            timeout=aiohttp.ClientTimeout(total=30)
+        )
+        # Created here so they bind to the loop running the scrape
+        self.semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+        self.limiter = AsyncLimiter(REQUESTS_PER_SECOND, 1)
+        os.makedirs(os.path.dirname(ETAG_CACHE_PATH), exist_ok=True)
+        self.etags = shelve.open(ETAG_CACHE_PATH)
+        # shelve does blocking disk I/O and isn't thread-safe: one dedicated thread
+        self._etag_io = ThreadPoolExecutor(max_workers=1, thread_name_prefix='etag')
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+        self.session = None
+        self._etag_io.shutdown(wait=True)
+        self._etag_io = None
+        self.etags.close()
+        self.etags = None
+    
+    async def _get_json(self, url: str, params: Optional[Dict] = None, conditional: bool = False) -> Dict:
+        """Fetch a JSON endpoint within the concurrency and rate limits
+        
+        With conditional=True the request carries the stored ETag and a 304
+        reuses the stored payload.
+        """
+        loop = asyncio.get_running_loop()
+        cache_key = f"{url}?{urlencode(params)}" if params else url
+        cached = await loop.run_in_executor(self._etag_io, self.etags.get, cache_key) if conditional else None
+        headers = {'If-None-Match': cached['etag']} if cached else None
+        
+        async with self.semaphore, self.limiter:
+            async with self.session.get(url, params=params, headers=headers) as response:
+                if response.status == 304 and cached:
+                    # Unchanged since the last scrape, reuse the stored payload
+                    return cached['data']
+                
+                response.raise_for_status()
+                data = await response.json()
+                etag = response.headers.get('ETag')
         
-    def get_category_topics(self, category_slug: str, start_date: datetime, end_date: datetime) -> List[Dict]:
+        if conditional and etag:
+            await loop.run_in_executor(
+                self._etag_io, self.etags.__setitem__, cache_key, {'etag': etag, 'data': data}
+            )
+        
+        return data
+        
+    async def get_category_topics(self, category_slug: str, start_date: datetime, end_date: datetime) -> List[Dict]:
         """Get topics from a specific category within date range"""
         topics = []
         page = 0
@@ -33,10 +100,7 @@ class DiscourseScraper:
                 url = f"{self.base_url}/c/{category_slug}.json"
                 params = {'page': page}
                 
-                response = self.session.get(url, params=params, timeout=30)
-                response.raise_for_status()
-                
-                data = response.json()
+                data = await self._get_json(url, params=params)
                 topic_list = data.get('topic_list', {})
                 topic_items = topic_list.get('topics', [])
                 
@@ -60,7 +124,6 @@ class DiscourseScraper:
                         topics.append(topic_data)
                 
                 page += 1
-                time.sleep(1)  # Rate limiting
                 
             except Exception as e:
                 logger.error(f"Error fetching category {category_slug}, page {page}: {str(e)}")
@@ -68,14 +131,11 @@ class DiscourseScraper:
         
         return topics
     
-    def get_topic_content(self, topic_id: int, topic_slug: str) -> Optional[Dict]:
+    async def get_topic_content(self, topic_id: int, topic_slug: str) -> Optional[Dict]:
         """Get the full content of a topic including posts"""
         try:
             url = f"{self.base_url}/t/{topic_slug}/{topic_id}.json"
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-            
-            data = response.json()
+            data = await self._get_json(url, conditional=True)
             
             # Extract main post content
             posts = data.get('post_stream', {}).get('posts', [])
@@ -90,9 +150,8 @@ class DiscourseScraper:
                 # Use trafilatura to extract clean text
                 clean_content = trafilatura.extract(raw_content, include_links=False)
                 if not clean_content:
-                    # Fallback to BeautifulSoup
-                    soup = BeautifulSoup(raw_content, 'html.parser')
-                    clean_content = soup.get_text(strip=True)
+                    # Fallback to plain HTML text extraction
+                    clean_content = LexborHTMLParser(raw_content).text(separator=' ', strip=True)
             else:
                 clean_content = main_post.get('raw', '')
             
@@ -103,8 +162,7 @@ class DiscourseScraper:
                 if reply_content:
                     clean_reply = trafilatura.extract(reply_content, include_links=False)
                     if not clean_reply:
-                        soup = BeautifulSoup(reply_content, 'html.parser')
-                        clean_reply = soup.get_text(strip=True)
+                        clean_reply = LexborHTMLParser(reply_content).text(separator=' ', strip=True)
                 else:
                     clean_reply = post.get('raw', '')
                 
@@ -131,15 +189,12 @@ class DiscourseScraper:
             logger.error(f"Error fetching topic {topic_id}: {str(e)}")
             return None
     
-    def find_tds_categories(self) -> List[str]:
+    async def find_tds_categories(self) -> List[str]:
         """Find categories related to Tools in Data Science"""
         try:
             # Get site categories
             url = f"{self.base_url}/categories.json"
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-            
-            data = response.json()
+            data = await self._get_json(url)
             categories = data.get('category_list', {}).get('categories', [])
             
             tds_categories = []
@@ -165,12 +220,12 @@ class DiscourseScraper:
             logger.error(f"Error finding TDS categories: {str(e)}")
             return ['general']  # Fallback to general category
     
-    def scrape_posts(self, start_date: datetime, end_date: datetime, max_posts: int = 100) -> List[Dict]:
+    async def scrape_posts(self, start_date: datetime, end_date: datetime, max_posts: int = 100) -> List[Dict]:
         """Scrape Discourse posts within the specified date range"""
         logger.info(f"Starting scrape from {start_date} to {end_date}")
         
         # Find TDS-related categories
-        categories = self.find_tds_categories()
+        categories = await self.find_tds_categories()
         logger.info(f"Scraping categories: {categories}")
         
         all_posts = []
@@ -179,22 +234,24 @@ class DiscourseScraper:
             logger.info(f"Scraping category: {category}")
             
             # Get topics from this category
-            topics = self.get_category_topics(category, start_date, end_date)
+            topics = await self.get_category_topics(category, start_date, end_date)
             logger.info(f"Found {len(topics)} topics in {category}")
             
-            for topic in topics:
-                if len(all_posts) >= max_posts:
-                    break
+            # Fetch topic contents concurrently, never more than are still needed
+            while topics and len(all_posts) < max_posts:
+                needed = max_posts - len(all_posts)
+                batch, topics = topics[:needed], topics[needed:]
                 
-                # Get topic content
-                content = self.get_topic_content(topic['id'], topic['slug'])
-                if content:
-                    # Merge topic metadata with content
-                    post_data = {**topic, **content}
-                    all_posts.append(post_data)
-                    logger.info(f"Scraped: {topic['title'][:50]}...")
+                contents = await asyncio.gather(
+                    *(self.get_topic_content(topic['id'], topic['slug']) for topic in batch)
+                )
                 
-                time.sleep(1)  # Rate limiting
+                for topic, content in zip(batch, contents):
+                    if content:
+                        # Merge topic metadata with content
+                        post_data = {**topic, **content}
+                        all_posts.append(post_data)
+                        logger.info(f"Scraped: {topic['title'][:50]}...")
             
             if len(all_posts) >= max_posts:
                 break
@@ -202,20 +259,20 @@ class DiscourseScraper:
         logger.info(f"Scraped {len(all_posts)} posts total")
         return all_posts
     
+    async def scrape(self, start_date: datetime, end_date: datetime, max_posts: int = 100) -> List[Dict]:
+        """Run scrape_posts within a fresh HTTP session"""
+        async with self:
+            return await self.scrape_posts(start_date, end_date, max_posts)
+    
     def save_posts(self, posts: List[Dict], filename: str = "data/tds_posts.json"):
-        """Save scraped posts to JSON file"""
+        """Save scraped posts as JSON Lines, one post per line"""
         # Ensure data directory exists
         os.makedirs(os.path.dirname(filename), exist_ok=True)
         
-        # Add metadata
-        data = {
-            'scraped_at': datetime.now().isoformat(),
-            'total_posts': len(posts),
-            'posts': posts
-        }
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(data['posts'], f, indent=2, ensure_ascii=False)
+        # Serialize post by post so the whole file never has to exist in memory
+        with open(filename, 'wb') as f:
+            for post in posts:
+                f.write(orjson.dumps(post) + b"\n")
         
         logger.info(f"Saved {len(posts)} posts to {filename}")
 
@@ -243,7 +300,7 @@ def main():
     scraper = DiscourseScraper()
     
     # Scrape posts
-    posts = scraper.scrape_posts(start_date, end_date, args.max_posts)
+    posts = asyncio.run(scraper.scrape(start_date, end_date, args.max_posts))
     
     # Save posts
     scraper.save_posts(posts, args.output)